@@ -8,14 +8,15 @@ CTN90pct: 3+ consecutive days where Tmin > calendar-day 90th percentile of Tmin
 Thresholds use a 15-day centred window across the base period (2015-2020).
 """
 
-import json
 import math
-from collections import defaultdict
+import warnings
 from datetime import datetime, timedelta
 from pathlib import Path
 
+import orjson
 import pandas as pd
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 INPUT_CSV = BASE_DIR / "data" / "imputed_data.csv"
@@ -30,57 +31,80 @@ WINDOW_HALF = 7        # 15-day window = day-7 … day+7
 def load_daily(csv_path):
     """Load hourly CSV → compute daily Tmax and Tmin per station."""
     print("Loading CSV …")
-    df = pd.read_csv(csv_path, parse_dates=["date"], dayfirst=True)
+    df = pd.read_csv(csv_path, parse_dates=["date"], dayfirst=True,
+                     dtype={"station": "category", "temperature": "float32"})
     df = df.dropna(subset=["temperature"])
     df["day"] = df["date"].dt.date
 
     print("Computing daily Tmax / Tmin …")
-    grouped = df.groupby(["station", "day"])["temperature"]
-    counts = grouped.count()
-    tmax = grouped.max()
-    tmin = grouped.min()
-
-    daily = pd.DataFrame({"tmax": tmax, "tmin": tmin, "count": counts})
+    daily = df.groupby(["station", "day"], observed=True)["temperature"].agg(
+        tmax="max", tmin="min", count="count"
+    )
     daily = daily[daily["count"] >= MIN_HOURLY].drop(columns="count").reset_index()
+    # Readings are stored to 2 dp, so rounding recovers their exact float64 values
+    daily[["tmax", "tmin"]] = daily[["tmax", "tmin"]].astype(np.float64).round(2)
     daily["day"] = pd.to_datetime(daily["day"])
-    daily["doy"] = daily["day"].dt.dayofyear
-    daily["year"] = daily["day"].dt.year
+    daily["doy"] = daily["day"].dt.dayofyear.astype(np.uint16)
+    daily["year"] = daily["day"].dt.year.astype(np.uint16)
     print(f"  {len(daily)} station-days retained (>={MIN_HOURLY} hourly readings)")
     return daily
 
 
+def _doy_matrix(doys, values):
+    """(366, k) matrix of `values` with one row per DOY, NaN-padded to the busiest DOY."""
+    order = np.argsort(doys, kind="stable")
+    doys = doys[order]
+    # position of each observation within its DOY row
+    starts = np.searchsorted(doys, np.arange(1, 367), side="left")
+    pos = np.arange(len(doys)) - starts[doys - 1]
+    width = int(pos.max()) + 1 if len(pos) else 1
+    mat = np.full((366, width), np.nan)
+    mat[doys - 1, pos] = values[order]
+    return mat
+
+
+def _windowed_percentile(doy_mat):
+    """90th percentile over each DOY's 15-day window, NaN where the window is empty."""
+    # wrap the year boundary, then take zero-copy (366, k, 15) windows over the DOY axis
+    padded = np.concatenate([doy_mat[-WINDOW_HALF:], doy_mat, doy_mat[:WINDOW_HALF]])
+    windows = sliding_window_view(padded, 2 * WINDOW_HALF + 1, axis=0).reshape(366, -1)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)  # all-NaN windows
+        return np.nanpercentile(windows, 90, axis=1)
+
+
 def compute_thresholds(daily):
     """Calendar-day 90th-percentile thresholds per station (15-day window, base period)."""
     print("Computing 90th-percentile thresholds …")
     base = daily[(daily["year"] >= BASE_PERIOD[0]) & (daily["year"] <= BASE_PERIOD[1])]
     stations = sorted(daily["station"].unique())
+    base_groups = dict(tuple(base.groupby("station", sort=False, observed=True)))
     thresholds = {}  # station → {ctx: [366], ctn: [366]}
 
     for stn in stations:
-        stn_data = base[base["station"] == stn]
-        ctx = []
-        ctn = []
-        for doy in range(1, 367):
-            # 15-day centred window (wraps around year boundaries)
-            doys_in_window = set()
-            for offset in range(-WINDOW_HALF, WINDOW_HALF + 1):
-                d = doy + offset
-                if d < 1:
-                    d += 366
-                elif d > 366:
-                    d -= 366
-                doys_in_window.add(d)
-            window = stn_data[stn_data["doy"].isin(doys_in_window)]
-            ctx_val = float(np.nanpercentile(window["tmax"], 90)) if len(window) else np.nan
-            ctn_val = float(np.nanpercentile(window["tmin"], 90)) if len(window) else np.nan
-            ctx.append(round(ctx_val, 2) if not math.isnan(ctx_val) else None)
-            ctn.append(round(ctn_val, 2) if not math.isnan(ctn_val) else None)
-        thresholds[stn] = {"ctx": ctx, "ctn": ctn}
+        # stations without base-period data get all-None thresholds
+        stn_data = base_groups.get(stn, base.iloc[:0])
+        doys = stn_data["doy"].to_numpy()
+        ctx = _windowed_percentile(_doy_matrix(doys, stn_data["tmax"].to_numpy(dtype=float)))
+        ctn = _windowed_percentile(_doy_matrix(doys, stn_data["tmin"].to_numpy(dtype=float)))
+        thresholds[stn] = {
+            "ctx": [None if math.isnan(v) else round(v, 2) for v in ctx.tolist()],
+            "ctn": [None if math.isnan(v) else round(v, 2) for v in ctn.tolist()],
+        }
 
     print(f"  Thresholds computed for {len(stations)} stations")
     return thresholds
 
 
+def _exceedance_runs(exceeded):
+    """Return (starts, lengths) of runs of True at least HW_MIN_DAYS long."""
+    edges = np.diff(np.r_[False, exceeded, False].astype(np.int8))
+    starts = np.flatnonzero(edges == 1)
+    lengths = np.flatnonzero(edges == -1) - starts
+    keep = lengths >= HW_MIN_DAYS
+    return starts[keep], lengths[keep]
+
+
 def detect_heatwaves(daily, thresholds):
     """Flag exceedance days and group into heatwave events (>=3 consecutive days)."""
     print("Detecting heatwaves …")
@@ -88,62 +112,56 @@ def detect_heatwaves(daily, thresholds):
     events = []
     daily_records = []
 
+    daily_groups = dict(tuple(daily.groupby("station", sort=False, observed=True)))
+
     for stn in stations:
-        stn_df = daily[daily["station"] == stn].sort_values("day").copy()
+        stn_df = daily_groups[stn].sort_values("day")
         ctx_map = thresholds[stn]["ctx"]
         ctn_map = thresholds[stn]["ctn"]
 
-        rows = []
-        for _, r in stn_df.iterrows():
-            doy = int(r["doy"])
-            ctx_thresh = ctx_map[doy - 1]
-            ctn_thresh = ctn_map[doy - 1]
-            ctx_exc = bool(r["tmax"] > ctx_thresh) if ctx_thresh is not None else False
-            ctn_exc = bool(r["tmin"] > ctn_thresh) if ctn_thresh is not None else False
-            rows.append({
-                "date": r["day"].strftime("%Y-%m-%d"),
-                "tmax": round(float(r["tmax"]), 2),
-                "tmin": round(float(r["tmin"]), 2),
-                "ctx_threshold": ctx_thresh,
-                "ctn_threshold": ctn_thresh,
-                "ctx_exceeded": ctx_exc,
-                "ctn_exceeded": ctn_exc,
-            })
+        doy_idx = stn_df["doy"].to_numpy() - 1
+        dates = stn_df["day"].dt.strftime("%Y-%m-%d").to_numpy()
+        tmax = np.round(stn_df["tmax"].to_numpy(dtype=float), 2)
+        tmin = np.round(stn_df["tmin"].to_numpy(dtype=float), 2)
+        # None thresholds become NaN, and NaN comparisons are never exceedances
+        ctx_thresh = np.array(ctx_map, dtype=float)[doy_idx]
+        ctn_thresh = np.array(ctn_map, dtype=float)[doy_idx]
+        ctx_exc = stn_df["tmax"].to_numpy(dtype=float) > ctx_thresh
+        ctn_exc = stn_df["tmin"].to_numpy(dtype=float) > ctn_thresh
+
+        rows = [
+            {
+                "date": date,
+                "tmax": hi,
+                "tmin": lo,
+                "ctx_threshold": ctx_map[d],
+                "ctn_threshold": ctn_map[d],
+                "ctx_exceeded": cx,
+                "ctn_exceeded": cn,
+            }
+            for date, hi, lo, d, cx, cn in zip(
+                dates.tolist(), tmax.tolist(), tmin.tolist(),
+                doy_idx.tolist(), ctx_exc.tolist(), ctn_exc.tolist(),
+            )
+        ]
         daily_records.append({"station": stn, "days": rows})
 
         # Group consecutive exceedance days into events
-        for hw_type, flag_key, temp_key in [
-            ("daytime", "ctx_exceeded", "tmax"),
-            ("nighttime", "ctn_exceeded", "tmin"),
+        for hw_type, exceeded, temps in [
+            ("daytime", ctx_exc, tmax),
+            ("nighttime", ctn_exc, tmin),
         ]:
-            run = []
-            for row in rows:
-                if row[flag_key]:
-                    run.append(row)
-                else:
-                    if len(run) >= HW_MIN_DAYS:
-                        temps = [r[temp_key] for r in run]
-                        events.append({
-                            "station": stn,
-                            "type": hw_type,
-                            "start_date": run[0]["date"],
-                            "end_date": run[-1]["date"],
-                            "duration": len(run),
-                            "peak_temp": round(max(temps), 2),
-                            "mean_temp": round(sum(temps) / len(temps), 2),
-                        })
-                    run = []
-            # flush last run
-            if len(run) >= HW_MIN_DAYS:
-                temps = [r[temp_key] for r in run]
+            starts, lengths = _exceedance_runs(exceeded)
+            for start, length in zip(starts.tolist(), lengths.tolist()):
+                run = temps[start:start + length]
                 events.append({
                     "station": stn,
                     "type": hw_type,
-                    "start_date": run[0]["date"],
-                    "end_date": run[-1]["date"],
-                    "duration": len(run),
-                    "peak_temp": round(max(temps), 2),
-                    "mean_temp": round(sum(temps) / len(temps), 2),
+                    "start_date": dates[start],
+                    "end_date": dates[start + length - 1],
+                    "duration": length,
+                    "peak_temp": round(float(run.max()), 2),
+                    "mean_temp": round(float(run.sum()) / length, 2),
                 })
 
     print(f"  {len(events)} heatwave events detected")
@@ -153,31 +171,31 @@ def detect_heatwaves(daily, thresholds):
 def compute_yearly_aspects(events):
     """HWN, HWF, HWD, HWA, HWM per station per year per type."""
     print("Computing yearly heatwave aspects …")
-    # group events
-    groups = defaultdict(list)
-    for ev in events:
-        year = int(ev["start_date"][:4])
-        groups[(ev["station"], year, ev["type"])].append(ev)
-
-    aspects = []
-    for (stn, year, hw_type), evts in sorted(groups.items()):
-        hwn = len(evts)
-        hwf = sum(e["duration"] for e in evts)
-        hwd = max(e["duration"] for e in evts)
-        hwa = max(e["peak_temp"] for e in evts)
-        total_days = sum(e["duration"] for e in evts)
-        weighted_sum = sum(e["mean_temp"] * e["duration"] for e in evts)
-        hwm = round(weighted_sum / total_days, 2) if total_days else None
-        aspects.append({
-            "station": stn,
-            "year": year,
-            "type": hw_type,
-            "HWN": hwn,
-            "HWF": hwf,
-            "HWD": hwd,
-            "HWA": round(hwa, 2),
-            "HWM": hwm,
-        })
+    if not events:
+        print("  0 station-year-type aspect rows")
+        return []
+
+    df_ev = pd.DataFrame(events)
+    df_ev["year"] = df_ev["start_date"].str[:4].astype(int)
+    df_ev["weighted"] = df_ev["mean_temp"] * df_ev["duration"]
+
+    grouped = df_ev.groupby(["station", "year", "type"])
+    aspects = grouped.agg(
+        HWN=("duration", "size"),
+        HWF=("duration", "sum"),
+        HWD=("duration", "max"),
+        HWA=("peak_temp", "max"),
+        # left-to-right float sum, not pandas' compensated one, so HWM keeps
+        # its published last-bit value
+        weighted=("weighted", lambda s: sum(s.tolist())),
+    )
+    aspects["HWA"] = aspects["HWA"].round(2)
+    # Python's round: weighted / HWF often lands exactly on x.xx5, where
+    # pandas' scale-and-round-half-even gives a different result
+    aspects["HWM"] = [
+        round(w / f, 2) for w, f in zip(aspects.pop("weighted").tolist(), aspects["HWF"].tolist())
+    ]
+    aspects = aspects.reset_index().to_dict("records")
     print(f"  {len(aspects)} station-year-type aspect rows")
     return aspects
 
@@ -199,8 +217,7 @@ def main():
     }
 
     print(f"Writing {OUTPUT_JSON} …")
-    with open(OUTPUT_JSON, "w") as f:
-        json.dump(output, f)
+    OUTPUT_JSON.write_bytes(orjson.dumps(output, option=orjson.OPT_SERIALIZE_NUMPY))
     size_mb = OUTPUT_JSON.stat().st_size / (1024 * 1024)
     print(f"Done — {size_mb:.1f} MB written.")
 
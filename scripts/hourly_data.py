@@ -0,0 +1,93 @@
+"""Shared reader for the raw hourly CSV, used by impute.py and preprocess.py."""
+
+import os
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+PROJECT_ROOT = SCRIPT_DIR.parent
+
+# Cleaned hourly data; rebuilt when the CSV is newer or the version differs
+CACHE_PARQUET = PROJECT_ROOT / "data" / "hourly_clean.parquet"
+
+# Stored in the cache's Parquet metadata; bump whenever read_hourly_csv changes
+# the cleaned values or schema
+CACHE_VERSION = b"2"
+CACHE_VERSION_KEY = b"hourly_cache_version"
+
+COLUMNS = {
+    "DATE Asia/Singapore (+0800)": "date",
+    "ID_STATION": "station",
+    "Temperature (°C)": "temperature",
+    "RH (%)": "rh",
+    "Scalar Mean Wind Direction (°)": "wind_dir",
+    "Scalar Mean Wind Speed (kts)": "wind_speed",
+    "Total Rainfall (mm)": "rainfall",
+    "Total Duration (mins)": "duration",
+    "Visibility": "visibility",
+    "Global Rad (MJ/m²)": "global_rad",
+}
+
+# Visibility is 82.5% missing and unused, so it is never read
+USECOLS = [src for src, name in COLUMNS.items() if name != "visibility"]
+DTYPES = {src: "float32" for src in USECOLS if COLUMNS[src] not in ("date", "station")}
+
+
+def read_hourly_csv(path: Path) -> pd.DataFrame:
+    """Parse and clean the raw hourly CSV."""
+    print(f"Reading {path} ...")
+    df = pd.read_csv(path, encoding="latin-1", engine="pyarrow",
+                     usecols=USECOLS, dtype=DTYPES)
+    df.rename(columns=COLUMNS, inplace=True)
+    df["date"] = pd.to_datetime(df["date"], format="%d/%m/%Y %H:%M", cache=True)
+    df["station"] = df["station"].astype("category")
+
+    # Fix wind direction > 360
+    mask = df["wind_dir"].notna()
+    df.loc[mask, "wind_dir"] = df.loc[mask, "wind_dir"] % 360
+
+    # Cap RH at 100
+    mask_rh = df["rh"].notna() & (df["rh"] > 100)
+    df.loc[mask_rh, "rh"] = 100.0
+
+    # Convert wind speed from knots to m/s (1 kt = 0.514444 m/s)
+    mask_ws = df["wind_speed"].notna()
+    df.loc[mask_ws, "wind_speed"] = df.loc[mask_ws, "wind_speed"] * 0.514444
+    return df
+
+
+def cache_is_current(path: Path) -> bool:
+    """True if the Parquet cache is newer than `path` and written by this CACHE_VERSION."""
+    if not CACHE_PARQUET.exists() or CACHE_PARQUET.stat().st_mtime <= path.stat().st_mtime:
+        return False
+    metadata = pq.read_schema(CACHE_PARQUET).metadata or {}
+    return metadata.get(CACHE_VERSION_KEY) == CACHE_VERSION
+
+
+def read_hourly_cached(path: Path) -> pd.DataFrame:
+    """Cleaned hourly data, from the Parquet cache when it is current."""
+    if cache_is_current(path):
+        print(f"Reading cached {CACHE_PARQUET} ...")
+        return pd.read_parquet(CACHE_PARQUET)
+    df = read_hourly_csv(path)
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata(
+        {**table.schema.metadata, CACHE_VERSION_KEY: CACHE_VERSION}
+    )
+
+    # Write beside the cache and rename into place, so an interrupted run never
+    # leaves a truncated file that looks newer than the CSV
+    fd, tmp = tempfile.mkstemp(dir=CACHE_PARQUET.parent, suffix=".parquet.tmp")
+    os.close(fd)
+    try:
+        pq.write_table(table, tmp, compression="zstd")
+        os.replace(tmp, CACHE_PARQUET)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return df
@@ -11,9 +11,19 @@ list of "variable:strategy" pairs (e.g. "temperature:A,rh:A,wind_speed:B").
 Rows with no imputation have an empty impute_method field.
 """
 
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
+from pathlib import Path
+
 import pandas as pd
 import numpy as np
-from pathlib import Path
+import pyarrow as pa
+import pyarrow.compute as pc
+from numba import njit
+
+from hourly_data import read_hourly_cached
 
 SCRIPT_DIR = Path(__file__).resolve().parent
 PROJECT_ROOT = SCRIPT_DIR.parent
@@ -21,44 +31,34 @@ PROJECT_ROOT = SCRIPT_DIR.parent
 INPUT_CSV = PROJECT_ROOT / "data" / "Hrly data 2015-2020.csv"
 OUTPUT_CSV = PROJECT_ROOT / "data" / "imputed_data.csv"
 
-COLUMNS = {
-    "DATE Asia/Singapore (+0800)": "date",
-    "ID_STATION": "station",
-    "Temperature (°C)": "temperature",
-    "RH (%)": "rh",
-    "Scalar Mean Wind Direction (°)": "wind_dir",
-    "Scalar Mean Wind Speed (kts)": "wind_speed",
-    "Total Rainfall (mm)": "rainfall",
-    "Total Duration (mins)": "duration",
-    "Visibility": "visibility",
-    "Global Rad (MJ/m²)": "global_rad",
-}
-
 # Variables to impute (not rainfall — per the report)
 IMPUTE_VARS = ["temperature", "rh", "wind_speed"]
 
+# Physical bounds enforced on imputed values
+BOUNDS = {
+    "temperature": (-np.inf, np.inf),
+    "rh": (0.0, 100.0),
+    "wind_speed": (0.0, np.inf),
+}
 
-def load_and_clean(path: Path) -> pd.DataFrame:
-    print(f"Reading {path} ...")
-    df = pd.read_csv(path, encoding="latin-1")
-    df.rename(columns=COLUMNS, inplace=True)
-    df["date"] = pd.to_datetime(df["date"], format="%d/%m/%Y %H:%M", dayfirst=True)
+# Method codes returned by impute_series
+STRATEGY_CODES = {1: "A", 2: "B"}
 
-    # Fix wind direction > 360
-    mask = df["wind_dir"].notna()
-    df.loc[mask, "wind_dir"] = df.loc[mask, "wind_dir"] % 360
+# impute_method label for every per-row code pattern, indexed by the pattern's
+# base-3 key (first variable most significant)
+METHOD_KEY_WEIGHTS = 3 ** np.arange(len(IMPUTE_VARS) - 1, -1, -1)
+METHOD_LABELS = np.array([
+    ",".join(f"{var}:{STRATEGY_CODES[c]}" for var, c in zip(IMPUTE_VARS, pattern) if c)
+    for pattern in product(range(3), repeat=len(IMPUTE_VARS))
+], dtype=object)
 
-    # Cap RH at 100
-    mask_rh = df["rh"].notna() & (df["rh"] > 100)
-    df.loc[mask_rh, "rh"] = 100.0
 
-    # Convert wind speed from knots to m/s
-    mask_ws = df["wind_speed"].notna()
-    df.loc[mask_ws, "wind_speed"] = df.loc[mask_ws, "wind_speed"] * 0.514444
+def load_and_clean(path: Path) -> pd.DataFrame:
+    df = read_hourly_cached(path)
 
     # Add time components for diurnal profile
-    df["month"] = df["date"].dt.month
-    df["hour"] = df["date"].dt.hour
+    df["month"] = df["date"].dt.month.astype(np.uint8)
+    df["hour"] = df["date"].dt.hour.astype(np.uint8)
 
     df.sort_values(["station", "date"], inplace=True)
     df.reset_index(drop=True, inplace=True)
@@ -66,6 +66,7 @@ def load_and_clean(path: Path) -> pd.DataFrame:
     return df
 
 
+@njit(cache=True, nogil=True)
 def find_gaps(is_missing: np.ndarray) -> list[tuple[int, int]]:
     """Return list of (start_idx, length) for each contiguous block of True."""
     gaps = []
@@ -82,184 +83,275 @@ def find_gaps(is_missing: np.ndarray) -> list[tuple[int, int]]:
     return gaps
 
 
-def build_diurnal_profiles(df: pd.DataFrame) -> dict:
-    """Compute mean hourly profiles per station per month per variable."""
-    profiles = {}
-    for var in IMPUTE_VARS:
-        profiles[var] = df.groupby(["station", "month", "hour"])[var].mean()
-    return profiles
-
-
-def impute_gap_strategy_b(df_station: pd.DataFrame, indices: list[int],
-                          var: str, profiles: dict) -> np.ndarray:
+def build_diurnal_profiles(df: pd.DataFrame, stations: list) -> dict:
+    """
+    Compute mean hourly profiles per station per month per variable.
+    Each profile is a dense (n_stations, 12, 24) array indexed by
+    [station_idx, month - 1, hour], NaN where a cell was never observed.
+    """
+    grid = pd.MultiIndex.from_product(
+        [stations, range(1, 13), range(24)], names=["station", "month", "hour"]
+    )
+    means = df.groupby(["station", "month", "hour"], observed=True)[IMPUTE_VARS].mean().reindex(grid)
+    return {
+        var: means[var].to_numpy(dtype=np.float32).reshape(len(stations), 12, 24)
+        for var in IMPUTE_VARS
+    }
+
+
+@njit(cache=True, nogil=True)
+def clip_bounds(values: np.ndarray, lo: float, hi: float) -> np.ndarray:
+    """Clamp values to [lo, hi] in place, leaving NaN untouched."""
+    for i in range(len(values)):
+        if values[i] < lo:
+            values[i] = lo
+        elif values[i] > hi:
+            values[i] = hi
+    return values
+
+
+@njit(cache=True, nogil=True)
+def impute_gap_strategy_a(values: np.ndarray, start: int, length: int) -> np.ndarray:
+    """
+    Linear interpolation for a single short gap.
+    Falls back to the one available edge value; all-NaN if neither edge exists.
+    """
+    n = len(values)
+    before_val = values[start - 1] if start > 0 else np.nan
+    after_val = values[start + length] if start + length < n else np.nan
+
+    if not np.isnan(before_val) and not np.isnan(after_val):
+        return np.linspace(before_val, after_val, length + 2)[1:-1]
+    if not np.isnan(before_val):
+        return np.full(length, before_val)
+    if not np.isnan(after_val):
+        return np.full(length, after_val)
+    return np.full(length, np.nan)
+
+
+@njit(cache=True, nogil=True)
+def impute_gap_strategy_b(values: np.ndarray, months: np.ndarray, hours: np.ndarray,
+                          profile: np.ndarray, start: int, length: int) -> np.ndarray:
     """
     Diurnal cycle matching for a single gap.
     Uses the station's monthly hourly profile, adjusted by edge offsets.
     """
-    station = df_station.iloc[0]["station"]
-    rows = df_station.iloc[indices]
-    months = rows["month"].values
-    hours = rows["hour"].values
-    gap_len = len(indices)
+    n = len(values)
+    stop = start + length
 
     # Get profile values for each hour in the gap
-    profile_vals = np.array([
-        profiles[var].get((station, m, h), np.nan)
-        for m, h in zip(months, hours)
-    ])
+    profile_vals = np.empty(length)
+    for k in range(length):
+        profile_vals[k] = profile[months[start + k] - 1, hours[start + k]]
 
     # If profile has no data for these hours, can't impute
     if np.all(np.isnan(profile_vals)):
-        return np.full(gap_len, np.nan)
-
-    # Get edge values for offset blending
-    first_idx = indices[0]
-    last_idx = indices[-1]
-    col_values = df_station[var].values
-
-    # Value just before the gap
-    before_val = np.nan
-    if first_idx > 0:
-        before_val = col_values[first_idx - 1]
-
-    # Value just after the gap
-    after_val = np.nan
-    if last_idx < len(col_values) - 1:
-        after_val = col_values[last_idx + 1]
-
-    # Profile values at the edges
-    before_profile = np.nan
-    after_profile = np.nan
-    if not np.isnan(before_val) and first_idx > 0:
-        prev_row = df_station.iloc[first_idx - 1]
-        before_profile = profiles[var].get(
-            (station, int(prev_row["month"]), int(prev_row["hour"])), np.nan
-        )
-    if not np.isnan(after_val) and last_idx < len(col_values) - 1:
-        next_row = df_station.iloc[last_idx + 1]
-        after_profile = profiles[var].get(
-            (station, int(next_row["month"]), int(next_row["hour"])), np.nan
-        )
-
-    # Compute offsets
-    before_offset = (before_val - before_profile) if (
-        not np.isnan(before_val) and not np.isnan(before_profile)
-    ) else np.nan
-    after_offset = (after_val - after_profile) if (
-        not np.isnan(after_val) and not np.isnan(after_profile)
-    ) else np.nan
+        return profile_vals
+
+    # Offsets of the observed values either side of the gap from their profile
+    before_offset = np.nan
+    if start > 0 and not np.isnan(values[start - 1]):
+        before_offset = values[start - 1] - profile[months[start - 1] - 1, hours[start - 1]]
+    after_offset = np.nan
+    if stop < n and not np.isnan(values[stop]):
+        after_offset = values[stop] - profile[months[stop] - 1, hours[stop]]
 
     # Blend offset linearly across the gap
     if not np.isnan(before_offset) and not np.isnan(after_offset):
-        weights = np.linspace(1, 0, gap_len)
+        weights = np.linspace(1, 0, length)
         offsets = weights * before_offset + (1 - weights) * after_offset
     elif not np.isnan(before_offset):
-        offsets = np.full(gap_len, before_offset)
+        offsets = np.full(length, before_offset)
     elif not np.isnan(after_offset):
-        offsets = np.full(gap_len, after_offset)
+        offsets = np.full(length, after_offset)
     else:
-        offsets = np.zeros(gap_len)
+        offsets = np.zeros(length)
 
-    result = profile_vals + offsets
+    return profile_vals + offsets
 
-    # Enforce physical bounds
-    if var == "rh":
-        result = np.clip(result, 0, 100)
-    elif var == "wind_speed":
-        result = np.clip(result, 0, None)
 
-    return result
+@njit(cache=True, nogil=True)
+def impute_series(values: np.ndarray, months: np.ndarray, hours: np.ndarray,
+                  profile: np.ndarray, lo: float, hi: float) -> np.ndarray:
+    """
+    Apply Strategy A and B to one variable of one station, filling `values` in place.
+    Gaps are maximal NaN runs, so a fill never changes another gap's edge values.
+    Returns method codes per row: 0 = none, 1 = A, 2 = B.
+    """
+    codes = np.zeros(len(values), dtype=np.int8)
+
+    for start, length in find_gaps(np.isnan(values)):
+        if length > 24:
+            continue  # Skip gaps > 24 hours
+
+        if length <= 2:
+            # Strategy A: linear interpolation
+            result = impute_gap_strategy_a(values, start, length)
+            code = 1
+        else:
+            # Strategy B: diurnal cycle matching (3–24 hours)
+            result = impute_gap_strategy_b(values, months, hours, profile, start, length)
+            code = 2
+        if np.all(np.isnan(result)):
+            continue
+
+        values[start:start + length] = clip_bounds(result, lo, hi)
+        codes[start:start + length] = code
 
+    return codes
+
+
+def method_labels(codes: np.ndarray) -> np.ndarray:
+    """
+    Render an (n, len(IMPUTE_VARS)) strategy-code matrix as "var:strategy" strings,
+    e.g. "temperature:A,wind_speed:B", via a base-3 lookup into METHOD_LABELS.
+    """
+    return METHOD_LABELS[codes.astype(np.intp) @ METHOD_KEY_WEIGHTS]
 
-def impute_station(df_station: pd.DataFrame, profiles: dict) -> pd.DataFrame:
-    """Apply Strategy A and B to one station's data."""
-    df_station = df_station.copy()
+
+def impute_station(df_station: pd.DataFrame, profiles: dict, station_idx: int) -> pd.DataFrame:
+    """Apply Strategy A and B to one station's data; the input frame is left untouched."""
     n = len(df_station)
+    months = df_station["month"].to_numpy()
+    hours = df_station["hour"].to_numpy()
 
-    # Track imputation method per row: list of "var:strategy" strings
-    methods = [""] * n
+    cols = {v: df_station[v].to_numpy(dtype=np.float64, copy=True) for v in IMPUTE_VARS}
 
-    for var in IMPUTE_VARS:
-        is_missing = df_station[var].isna().values
-        gaps = find_gaps(is_missing)
-
-        for start, length in gaps:
-            if length > 24:
-                continue  # Skip gaps > 24 hours
-
-            indices = list(range(start, start + length))
-
-            if length <= 2:
-                # Strategy A: linear interpolation
-                # Get boundary values
-                before_val = np.nan
-                after_val = np.nan
-                if start > 0:
-                    before_val = df_station[var].iloc[start - 1]
-                if start + length < n:
-                    after_val = df_station[var].iloc[start + length]
-
-                if not np.isnan(before_val) and not np.isnan(after_val):
-                    interp = np.linspace(before_val, after_val, length + 2)[1:-1]
-                elif not np.isnan(before_val):
-                    interp = np.full(length, before_val)
-                elif not np.isnan(after_val):
-                    interp = np.full(length, after_val)
-                else:
-                    continue  # No boundary values, skip
-
-                if var == "rh":
-                    interp = np.clip(interp, 0, 100)
-                elif var == "wind_speed":
-                    interp = np.clip(interp, 0, None)
-
-                df_station.iloc[indices, df_station.columns.get_loc(var)] = interp
-                strategy = "A"
-            else:
-                # Strategy B: diurnal cycle matching (3–24 hours)
-                filled = impute_gap_strategy_b(df_station, indices, var, profiles)
-                if np.all(np.isnan(filled)):
-                    continue
-                df_station.iloc[indices, df_station.columns.get_loc(var)] = filled
-                strategy = "B"
-
-            # Record method
-            for idx in indices:
-                tag = f"{var}:{strategy}"
-                if methods[idx]:
-                    methods[idx] += "," + tag
-                else:
-                    methods[idx] = tag
-
-    df_station["impute_method"] = methods
-    return df_station
+    # Track imputation method per row and variable as strategy codes
+    codes = np.zeros((n, len(IMPUTE_VARS)), dtype=np.int8)
+
+    for j, var in enumerate(IMPUTE_VARS):
+        lo, hi = BOUNDS[var]
+        codes[:, j] = impute_series(cols[var], months, hours, profiles[var][station_idx], lo, hi)
+
+    filled = {v: cols[v].astype(df_station[v].dtype) for v in IMPUTE_VARS}
+    return df_station.assign(**filled, impute_method=method_labels(codes))
+
+
+def station_blocks(df: pd.DataFrame):
+    """
+    Yield (station, rows) for each station of a frame sorted by station.
+    Rows are positional slices, so unlike iterating a groupby (which first
+    takes a sorted copy of the whole frame) no station data is copied.
+    """
+    codes = df["station"].cat.codes.to_numpy()
+    bounds = np.flatnonzero(np.diff(codes)) + 1
+    for start, stop in zip([0, *bounds], [*bounds, len(df)]):
+        yield df["station"].iat[start], df.iloc[start:stop]
+
+
+def map_in_order(pool: ThreadPoolExecutor, fn, tasks, max_in_flight: int):
+    """
+    Yield (key, fn(*args)) for each (key, args) in `tasks`, in input order.
+    Unlike Executor.map, tasks are pulled lazily and at most `max_in_flight`
+    futures are pending at once.
+    """
+    pending = deque()
+
+    def pop_oldest():
+        # returned rather than held in a local, so the generator frame keeps
+        # no reference to a result once the caller has dropped it
+        key, future = pending.popleft()
+        return key, future.result()
+
+    for key, args in tasks:
+        pending.append((key, pool.submit(fn, *args)))
+        del args
+        if len(pending) >= max_in_flight:
+            yield pop_oldest()
+    while pending:
+        yield pop_oldest()
+
+
+def _csv_field(column: pa.ChunkedArray) -> pa.ChunkedArray:
+    """Render one column as CSV text in the layout pandas' to_csv produced.
+
+    Floats keep a trailing ".0" when whole, missing values are empty, and a
+    field is quoted only when it holds a delimiter, quote or newline (in
+    practice multi-variable impute_method labels).
+    """
+    text = pc.cast(column, pa.string())
+    if pa.types.is_floating(column.type):
+        # values are clipped to physical bounds, so never print in exponent form
+        whole = pc.equal(pc.floor(column), column)
+        text = pc.if_else(whole, pc.binary_join_element_wise(text, ".0", ""), text)
+    else:
+        quoted = pc.binary_join_element_wise('"', pc.replace_substring(text, '"', '""'), '"', "")
+        text = pc.if_else(pc.match_substring_regex(text, r'[",\r\n]'), quoted, text)
+    return pc.fill_null(text, "")
+
+
+def write_output_csv(df_station: pd.DataFrame, sink, include_header: bool) -> None:
+    """Append one station's imputed rows, dates as dd/mm/YYYY HH:MM.
+
+    Rows are rendered with Arrow compute kernels rather than Arrow's CSV
+    writer: its "needed" quoting wraps every string field and its "none"
+    quoting rejects the commas in multi-variable impute_method labels.
+    """
+    # Drop helper columns, format output
+    df_out = df_station.drop(columns=["month", "hour", "visibility"], errors="ignore")
+
+    # Round numeric columns
+    for col in ["temperature", "rh", "wind_speed", "wind_dir", "rainfall", "duration", "global_rad"]:
+        if col in df_out.columns:
+            df_out[col] = df_out[col].round(2)
+
+    table = pa.Table.from_pandas(df_out, preserve_index=False)
+    date_idx = table.schema.get_field_index("date")
+    table = table.set_column(date_idx, "date",
+                             pc.strftime(table["date"], format="%d/%m/%Y %H:%M"))
+
+    if include_header:
+        sink.write((",".join(table.column_names) + "\n").encode())
+    if table.num_rows == 0:
+        return
+    rows = pc.binary_join_element_wise(*[_csv_field(c) for c in table.columns], ",")
+    rows = rows.combine_chunks()
+    body = pc.binary_join(pa.ListArray.from_arrays([0, len(rows)], rows), "\n")[0]
+    sink.write(body.as_buffer())
+    sink.write(b"\n")
 
 
 def main():
     df = load_and_clean(INPUT_CSV)
 
-    print("Building diurnal profiles ...")
-    profiles = build_diurnal_profiles(df)
-
     stations = sorted(df["station"].unique())
-    print(f"Imputing {len(stations)} stations ...")
-
-    results = []
-    for i, st in enumerate(stations):
-        df_st = df[df["station"] == st].copy()
-        df_st = impute_station(df_st, profiles)
-        results.append(df_st)
-        # Count imputed rows
-        imputed = (df_st["impute_method"] != "").sum()
-        print(f"  [{i+1}/{len(stations)}] {st}: {imputed:,} rows imputed")
+    station_idx = {st: i for i, st in enumerate(stations)}
 
-    df_out = pd.concat(results, ignore_index=True)
-    df_out.sort_values(["station", "date"], inplace=True)
+    print("Building diurnal profiles ...")
+    profiles = build_diurnal_profiles(df, stations)
+
+    print(f"Imputing {len(stations)} stations into {OUTPUT_CSV} ...")
+    total_imputed = a_count = b_count = 0
+    remaining = dict.fromkeys(IMPUTE_VARS, 0)
+
+    # Stations arrive in sorted order and each is already sorted by date, so
+    # chunks are appended to the output as they finish instead of concatenated
+    # and re-sorted. The numba kernels release the GIL, so stations impute
+    # concurrently in threads, with at most `workers` station frames alive.
+    workers = os.cpu_count() or 1
+    tasks = (
+        (st, (df_st, profiles, station_idx[st]))
+        for st, df_st in station_blocks(df)
+    )
+    with ThreadPoolExecutor(max_workers=workers) as pool, open(OUTPUT_CSV, "wb") as f:
+        results = map_in_order(pool, impute_station, tasks, max_in_flight=workers)
+        for i, (st, df_st) in enumerate(results):
+            methods = df_st["impute_method"]
+            # Count imputed rows
+            imputed = (methods != "").sum()
+            print(f"  [{i+1}/{len(stations)}] {st}: {imputed:,} rows imputed")
+
+            total_imputed += imputed
+            a_count += methods.str.contains(":A", na=False).sum()
+            b_count += methods.str.contains(":B", na=False).sum()
+            for var in IMPUTE_VARS:
+                remaining[var] += df_st[var].isna().sum()
+
+            write_output_csv(df_st, f, include_header=(i == 0))
+            del df_st, methods  # release the written station before the next one
 
     # Print summary
-    total_imputed = (df_out["impute_method"] != "").sum()
-    a_count = df_out["impute_method"].str.contains(":A", na=False).sum()
-    b_count = df_out["impute_method"].str.contains(":B", na=False).sum()
     print(f"\nImputation complete:")
     print(f"  Total rows with imputation: {total_imputed:,}")
     print(f"  Rows using Strategy A (linear, 1-2h): {a_count:,}")
@@ -269,23 +361,12 @@ def main():
     print(f"\nRemaining missing after imputation:")
     for var in IMPUTE_VARS:
         before = df[var].isna().sum()
-        after = df_out[var].isna().sum()
+        after = remaining[var]
         filled = before - after
         print(f"  {var}: {before:,} -> {after:,} ({filled:,} filled, {filled/before*100:.1f}%)")
 
-    # Drop helper columns, format output
-    df_out.drop(columns=["month", "hour", "visibility"], inplace=True, errors="ignore")
-    df_out["date"] = df_out["date"].dt.strftime("%d/%m/%Y %H:%M")
-
-    # Round numeric columns
-    for col in ["temperature", "rh", "wind_speed", "wind_dir", "rainfall", "duration", "global_rad"]:
-        if col in df_out.columns:
-            df_out[col] = df_out[col].round(2)
-
-    print(f"\nWriting {OUTPUT_CSV} ...")
-    df_out.to_csv(OUTPUT_CSV, index=False)
     size_mb = OUTPUT_CSV.stat().st_size / 1_048_576
-    print(f"Done. Output size: {size_mb:.1f} MB")
+    print(f"\nDone. Output size: {size_mb:.1f} MB")
 
 
 if __name__ == "__main__":
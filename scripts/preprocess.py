@@ -1,31 +1,19 @@
 #!/usr/bin/env python3
 """Preprocess hourly weather data (2015-2020) into aggregated JSON for the dashboard."""
 
-import json
-import math
+import orjson
 import pandas as pd
 import numpy as np
 from pathlib import Path
 
+from hourly_data import read_hourly_cached
+
 SCRIPT_DIR = Path(__file__).resolve().parent
 PROJECT_ROOT = SCRIPT_DIR.parent
 
 INPUT_CSV = PROJECT_ROOT / "data" / "Hrly data 2015-2020.csv"
 OUTPUT_JSON = PROJECT_ROOT / "data" / "dashboard_data.json"
 
-COLUMNS = {
-    "DATE Asia/Singapore (+0800)": "date",
-    "ID_STATION": "station",
-    "Temperature (°C)": "temperature",
-    "RH (%)": "rh",
-    "Scalar Mean Wind Direction (°)": "wind_dir",
-    "Scalar Mean Wind Speed (kts)": "wind_speed",
-    "Total Rainfall (mm)": "rainfall",
-    "Total Duration (mins)": "duration",
-    "Visibility": "visibility",
-    "Global Rad (MJ/m²)": "global_rad",
-}
-
 VARS_FOR_DASHBOARD = ["temperature", "rh", "wind_speed", "rainfall", "global_rad"]
 VAR_LABELS = {
     "temperature": "Temperature (°C)",
@@ -37,33 +25,15 @@ VAR_LABELS = {
 
 
 def load_and_clean(path: Path) -> pd.DataFrame:
-    print(f"Reading {path} ...")
-    df = pd.read_csv(path, encoding="latin-1")
-    df.rename(columns=COLUMNS, inplace=True)
-
-    # Parse dates
-    df["date"] = pd.to_datetime(df["date"], format="%d/%m/%Y %H:%M", dayfirst=True)
-    df["year"] = df["date"].dt.year
-    df["month"] = df["date"].dt.month
-    df["hour"] = df["date"].dt.hour
+    df = read_hourly_cached(path)
+
+    # Date components for aggregation
+    df["year"] = df["date"].dt.year.astype(np.uint16)
+    df["month"] = df["date"].dt.month.astype(np.uint8)
+    df["hour"] = df["date"].dt.hour.astype(np.uint8)
     df["ym"] = df["date"].dt.to_period("M").astype(str)  # e.g. "2015-01"
     df["ymd"] = df["date"].dt.strftime("%Y-%m-%d")
 
-    # Drop Visibility (82.5% missing)
-    df.drop(columns=["visibility"], inplace=True, errors="ignore")
-
-    # Fix wind direction > 360
-    mask = df["wind_dir"].notna()
-    df.loc[mask, "wind_dir"] = df.loc[mask, "wind_dir"] % 360
-
-    # Cap RH at 100
-    mask_rh = df["rh"].notna() & (df["rh"] > 100)
-    df.loc[mask_rh, "rh"] = 100.0
-
-    # Convert wind speed from knots to m/s (1 kt = 0.514444 m/s)
-    mask_ws = df["wind_speed"].notna()
-    df.loc[mask_ws, "wind_speed"] = df.loc[mask_ws, "wind_speed"] * 0.514444
-
     print(f"Loaded {len(df):,} rows, {df['station'].nunique()} stations")
     return df
 
@@ -83,55 +53,60 @@ def missing_data_summary(df: pd.DataFrame) -> list:
     return rows
 
 
+def _grouped_stats(df: pd.DataFrame, keys: list, variables: list) -> pd.DataFrame:
+    """Single groupby pass: row count, valid count and mean (sum for rainfall) per variable."""
+    agg = {"rows": (variables[0], "size")}
+    for v in variables:
+        agg[f"{v}_count"] = (v, "count")
+        agg[f"{v}_value"] = (v, "sum" if v == "rainfall" else "mean")
+    return df.groupby(keys, observed=True).agg(**agg)
+
+
+def _value_columns(stats: pd.DataFrame, variables: list) -> pd.DataFrame:
+    """Rounded aggregate per variable, NaN where a group has no valid readings."""
+    return pd.DataFrame({
+        v: stats[f"{v}_value"].astype(float).where(stats[f"{v}_count"] > 0).round(2)
+        for v in variables
+    })
+
+
+def _to_records(df: pd.DataFrame) -> list:
+    """DataFrame → list of dicts, with NaN replaced by None for JSON."""
+    return df.astype(object).where(df.notna(), None).to_dict("records")
+
+
 def monthly_aggregates(df: pd.DataFrame) -> list:
     """Monthly averages (and rainfall totals) per station."""
-    records = []
-    grouped = df.groupby(["station", "ym"])
-    for (st, ym), g in grouped:
-        total = len(g)
-        rec = {"station": st, "ym": ym}
-        # Temperature, RH, wind_speed: mean; rainfall: sum; global_rad: mean
-        for v in VARS_FOR_DASHBOARD:
-            valid = g[v].dropna()
-            missing_pct = round((total - len(valid)) / total * 100, 1)
-            rec[f"{v}_missing_pct"] = missing_pct
-            if v == "rainfall":
-                rec[v] = round(float(valid.sum()), 2) if len(valid) > 0 else None
-            else:
-                rec[v] = round(float(valid.mean()), 2) if len(valid) > 0 else None
-        records.append(rec)
-    return records
+    stats = _grouped_stats(df, ["station", "ym"], VARS_FOR_DASHBOARD)
+    values = _value_columns(stats, VARS_FOR_DASHBOARD)
+    out = pd.DataFrame(index=stats.index)
+    # Temperature, RH, wind_speed: mean; rainfall: sum; global_rad: mean
+    for v in VARS_FOR_DASHBOARD:
+        missing = stats["rows"] - stats[f"{v}_count"]
+        out[f"{v}_missing_pct"] = (missing / stats["rows"] * 100).round(1)
+        out[v] = values[v]
+    return _to_records(out.reset_index())
 
 
 def monthly_missing_counts(df: pd.DataFrame) -> list:
     """Missing data count per station per month per variable (for timeline chart)."""
-    records = []
-    grouped = df.groupby(["station", "ym"])
-    for (st, ym), g in grouped:
-        rec = {"station": st, "ym": ym}
-        for v in VARS_FOR_DASHBOARD:
-            rec[v] = int(g[v].isna().sum())
-        records.append(rec)
-    return records
+    grouped = df[VARS_FOR_DASHBOARD].isna().groupby([df["station"], df["ym"]], observed=True)
+    return grouped.sum().astype(int).reset_index().to_dict("records")
 
 
 def hourly_profiles(df: pd.DataFrame) -> list:
     """Average by hour-of-day per station (across all years)."""
-    records = []
-    grouped = df.groupby(["station", "hour"])
-    for (st, h), g in grouped:
-        rec = {"station": st, "hour": int(h)}
-        for v in ["temperature", "rh"]:
-            valid = g[v].dropna()
-            rec[v] = round(float(valid.mean()), 2) if len(valid) > 0 else None
-        records.append(rec)
-    return records
+    variables = ["temperature", "rh"]
+    stats = _grouped_stats(df, ["station", "hour"], variables)
+    out = _value_columns(stats, variables).reset_index()
+    out["hour"] = out["hour"].astype(int)
+    return _to_records(out)
 
 
 def daily_temp_minmax(df: pd.DataFrame) -> list:
     """Daily min and max temperature per station."""
     records = []
-    grouped = df.groupby(["station", "ymd"])
+    grouped = df.groupby(["station", "ymd"], observed=True)
     for (st, ymd), g in grouped:
         valid = g["temperature"].dropna()
         if len(valid) == 0:
@@ -147,31 +122,10 @@ def daily_temp_minmax(df: pd.DataFrame) -> list:
 
 def yearly_summary(df: pd.DataFrame) -> list:
     """Yearly averages per station."""
-    records = []
-    grouped = df.groupby(["station", "year"])
-    for (st, yr), g in grouped:
-        rec = {"station": st, "year": int(yr)}
-        for v in VARS_FOR_DASHBOARD:
-            valid = g[v].dropna()
-            if v == "rainfall":
-                rec[v] = round(float(valid.sum()), 2) if len(valid) > 0 else None
-            else:
-                rec[v] = round(float(valid.mean()), 2) if len(valid) > 0 else None
-        records.append(rec)
-    return records
-
-
-def sanitize(obj):
-    """Replace NaN/inf with None for JSON serialization."""
-    if isinstance(obj, float):
-        if math.isnan(obj) or math.isinf(obj):
-            return None
-        return obj
-    if isinstance(obj, dict):
-        return {k: sanitize(v) for k, v in obj.items()}
-    if isinstance(obj, list):
-        return [sanitize(v) for v in obj]
-    return obj
+    stats = _grouped_stats(df, ["station", "year"], VARS_FOR_DASHBOARD)
+    out = _value_columns(stats, VARS_FOR_DASHBOARD).reset_index()
+    out["year"] = out["year"].astype(int)
+    return _to_records(out)
 
 
 def main():
@@ -209,12 +163,9 @@ def main():
         "yearly": yearly,
     }
 
-    payload = sanitize(payload)
-
     OUTPUT_JSON.parent.mkdir(parents=True, exist_ok=True)
     print(f"Writing {OUTPUT_JSON} ...")
-    with open(OUTPUT_JSON, "w") as f:
-        json.dump(payload, f)
+    OUTPUT_JSON.write_bytes(orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY))
 
     size_mb = OUTPUT_JSON.stat().st_size / 1_048_576
     print(f"Done. Output size: {size_mb:.1f} MB")